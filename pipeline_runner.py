@@ -8,11 +8,28 @@
 
 import pandas as pd
 import numpy as np
-from mlxtend.frequent_patterns import apriori, association_rules
-from mlxtend.preprocessing import TransactionEncoder
+from collections import Counter
+try:
+    from efficient_apriori import apriori as ea_apriori
+except ImportError:
+    ea_apriori = None
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+try:
+    from joblib import Parallel, delayed
+except ImportError:
+    Parallel = None
+try:
+    import numba
+except ImportError:
+    numba = None
 import os
 import json
+import time
 import datetime
+import itertools
 import traceback
 
 # ── CONFIGURACIÓN ──
@@ -24,12 +41,44 @@ LOG_FILE = os.path.join(OUTPUT_DIR, "pipeline_log.txt")
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
+# Timestamp único de la corrida — se refresca al entrar a main() para que
+# todos los outputs de un mismo run compartan la misma fecha
+RUN_TS = datetime.datetime.now()
+
+# Handle de log abierto una sola vez en main() — evita un ciclo
+# open/write/close por mensaje (20+ syscalls por corrida)
+_LOG_FH = None
+
 def log(msg):
-    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # time.strftime es más barato que datetime y aquí sí queremos frescura
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
     entry = f"[{timestamp}] {msg}"
     print(entry)
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(entry + "\n")
+    if _LOG_FH is not None:
+        _LOG_FH.write(entry + "\n")
+    else:
+        # Fuera de main() (p. ej. import interactivo) no hay handle abierto
+        with open(LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(entry + "\n")
+
+def _read_csv_fast(path, usecols, dtype):
+    """
+    Lectura de CSV con schema explícito: sin inferencia de tipos y sin
+    alocar columnas que el pipeline no usa. Intenta el engine pyarrow y
+    cae al engine c si no está instalado; si el CSV no trae las columnas
+    esperadas, cae a la lectura sin hints.
+    """
+    try:
+        return pd.read_csv(path, usecols=usecols, dtype=dtype, engine='pyarrow')
+    except ImportError:
+        pass
+    except (ValueError, KeyError):
+        # pyarrow reporta columnas faltantes como KeyError
+        return pd.read_csv(path)
+    try:
+        return pd.read_csv(path, usecols=usecols, dtype=dtype)
+    except ValueError:
+        return pd.read_csv(path)
 
 def load_fresh_data():
     """
@@ -41,12 +90,41 @@ def load_fresh_data():
 
     if os.path.exists(fresh_path):
         log("✅ Datos frescos de n8n encontrados — cargando fresh_transactions.csv")
-        df = pd.read_csv(fresh_path)
+        df = _read_csv_fast(
+            fresh_path,
+            usecols=['category', 'product_a', 'product_b'],
+            dtype={'category': 'category', 'product_a': 'string', 'product_b': 'string'}
+        )
         log(f"   → {len(df)} transacciones cargadas")
         return df, "fresh"
     elif os.path.exists(original_path):
         log("⚠️  Datos frescos no encontrados — usando dataset original como fallback")
-        df = pd.read_csv(original_path)
+        df = None
+        if pl is not None:
+            # Scan lazy de polars: el filtro UK y la normalización corren
+            # en Rust durante la lectura, sin strings Python intermedios
+            try:
+                df = (
+                    pl.scan_csv(original_path)
+                    .select(['InvoiceNo', 'Description', 'Country', 'Quantity'])
+                    .filter(
+                        (pl.col('Country') == 'United Kingdom')
+                        & (pl.col('Quantity') > 0)
+                    )
+                    .with_columns(
+                        pl.col('Description').str.strip_chars().str.to_uppercase()
+                    )
+                    .collect()
+                )
+            except pl.exceptions.PolarsError:
+                df = None
+        if df is None:
+            df = _read_csv_fast(
+                original_path,
+                usecols=['InvoiceNo', 'Description', 'Country', 'Quantity'],
+                dtype={'InvoiceNo': 'string', 'Description': 'string',
+                       'Country': 'category', 'Quantity': 'int32'}
+            )
         log(f"   → {len(df)} registros del dataset original")
         return df, "original"
     else:
@@ -55,6 +133,20 @@ def load_fresh_data():
             "Asegúrate de que n8n ejecutó el pipeline o que el dataset original está en data/"
         )
 
+def _category_pairs(products):
+    """
+    Genera los pares de transacciones de una categoría con slicing numpy.
+    Replica el loop original: pares (i, i+1) e (i, i+2) con paso 2.
+    """
+    n = len(products)
+    if n < 2:
+        return []
+    products = np.asarray(products, dtype=object)
+    pairs = np.stack([products[0:n-1:2], products[1:n:2]], axis=1).tolist()
+    if n > 2:
+        pairs += np.stack([products[0:n-2:2], products[2:n:2]], axis=1).tolist()
+    return pairs
+
 def prepare_basket_matrix(df, source):
     """
     Prepara la matriz binaria de transacciones para Apriori.
@@ -64,24 +156,47 @@ def prepare_basket_matrix(df, source):
 
     if source == "fresh":
         # Datos de Open Food Facts via n8n
-        # Cada fila es un par product_a, product_b por categoría
-        transactions = []
-        for category in df['category'].unique():
-            cat_products = df[df['category'] == category]['product_a'].tolist()
-            cat_products += df[df['category'] == category]['product_b'].tolist()
-            cat_products = list(set(cat_products))
-            if len(cat_products) >= 2:
-                # Simular transacciones: cada par de productos es una compra
-                for i in range(0, len(cat_products) - 1, 2):
-                    transactions.append([cat_products[i], cat_products[i+1]])
-                    if i + 2 < len(cat_products):
-                        transactions.append([cat_products[i], cat_products[i+2]])
+        # Cada fila es un par product_a, product_b por categoría.
+        # Un solo melt + groupby en vez de dos filtrados por categoría
+        melted = df.melt(
+            id_vars='category',
+            value_vars=['product_a', 'product_b'],
+            value_name='product'
+        )
+        # Simular transacciones: cada par de productos es una compra.
+        # Cada categoría es independiente — con muchas categorías vale la
+        # pena repartirlas entre workers de joblib
+        groups = [
+            products.unique()
+            for _, products in melted.groupby('category', observed=True)['product']
+        ]
+        if Parallel is not None and len(groups) >= 8:
+            n_jobs = min(4, os.cpu_count() or 1)
+            results = Parallel(n_jobs=n_jobs, backend='loky')(
+                delayed(_category_pairs)(g) for g in groups
+            )
+        else:
+            results = [_category_pairs(g) for g in groups]
+        transactions = list(itertools.chain.from_iterable(results))
     else:
         # Dataset original: agrupar por InvoiceNo si existe
-        if 'InvoiceNo' in df.columns and 'Description' in df.columns:
-            df_uk = df[df.get('Country', pd.Series(['UK']*len(df))) == 'United Kingdom'].copy()
+        if pl is not None and isinstance(df, pl.DataFrame):
+            # Ya viene filtrado y normalizado desde el scan lazy;
+            # el group_by corre en Rust sin loop Python
+            transactions = (
+                df.group_by('InvoiceNo')
+                .agg(pl.col('Description'))
+                .get_column('Description')
+                .to_list()
+            )
+        elif 'InvoiceNo' in df.columns and 'Description' in df.columns:
+            if 'Country' in df.columns:
+                df_uk = df[df['Country'] == 'United Kingdom'].copy()
+            else:
+                df_uk = df.copy()
             df_uk = df_uk[df_uk['Quantity'] > 0]
-            df_uk['Description'] = df_uk['Description'].str.strip().str.upper()
+            # category dtype: una sola copia por descripción única
+            df_uk['Description'] = df_uk['Description'].str.strip().str.upper().astype('category')
             transactions = df_uk.groupby('InvoiceNo')['Description'].apply(list).tolist()
         else:
             log("⚠️  Formato desconocido — generando transacciones sintéticas para demo")
@@ -96,50 +211,187 @@ def prepare_basket_matrix(df, source):
     log(f"   → {len(transactions)} transacciones preparadas")
     return transactions
 
+RULE_COLUMNS = ['antecedents', 'consequents', 'support', 'confidence', 'lift']
+
+def _mine_efficient(transactions, min_support):
+    """
+    Minado con efficient_apriori: trabaja directo sobre las listas de
+    transacciones, sin pasar por TransactionEncoder ni basket matrix.
+    """
+    itemsets, rules = ea_apriori(
+        transactions,
+        min_support=min_support,
+        min_confidence=0.0,
+        max_length=2
+    )
+
+    n = len(transactions)
+    itemset_rows = [
+        {"support": count / n, "itemsets": frozenset(items)}
+        for by_size in itemsets.values()
+        for items, count in by_size.items()
+    ]
+    frequent_itemsets = pd.DataFrame(itemset_rows, columns=['support', 'itemsets'])
+
+    # Mismo criterio que antes: solo reglas con lift > 1.0
+    rule_rows = [
+        {
+            "antecedents": frozenset(r.lhs),
+            "consequents": frozenset(r.rhs),
+            "support": r.support,
+            "confidence": r.confidence,
+            "lift": r.lift,
+        }
+        for r in rules if r.lift > 1.0
+    ]
+    rules_df = pd.DataFrame(rule_rows, columns=RULE_COLUMNS)
+    return frequent_itemsets, rules_df
+
+if numba is not None:
+    # np.bitwise_count no está soportado dentro de njit — popcount por
+    # byte con tabla de 256 entradas
+    _POPCOUNT8 = np.array([bin(b).count('1') for b in range(256)], dtype=np.int64)
+
+    @numba.njit(parallel=True, cache=True)
+    def _count_pair_supports(bitmap, cand_i, cand_j, lut):
+        """Soporte de cada par candidato: AND + popcount, pares en prange."""
+        out = np.zeros(len(cand_i), dtype=np.int64)
+        for k in numba.prange(len(cand_i)):
+            i = cand_i[k]
+            j = cand_j[k]
+            c = 0
+            for w in range(bitmap.shape[0]):
+                c += lut[bitmap[w, i] & bitmap[w, j]]
+            out[k] = c
+        return out
+
+def _mine_bitmap(transactions, min_support):
+    """
+    Fallback sin efficient_apriori: conteo de soporte por popcount sobre
+    una matriz bit-packed (8 transacciones por byte). Especializado a
+    max_len=2, igual que los llamados originales a mlxtend.
+    """
+    empty_itemsets = pd.DataFrame(columns=['support', 'itemsets'])
+    n = len(transactions)
+    if n == 0:
+        return empty_itemsets, pd.DataFrame(columns=RULE_COLUMNS)
+
+    # Con max_len=2 fijo, Apriori se reduce a: (a) contar singles,
+    # (b) podar por soporte, (c) contar pares solo entre sobrevivientes.
+    # La poda ocurre ANTES de codificar — la matriz nunca tiene columnas
+    # de items que no pueden formar un par frecuente
+    item_counts = Counter(
+        itertools.chain.from_iterable(set(t) for t in transactions)
+    )
+    min_count = min_support * n
+    items = np.array(
+        sorted(x for x, c in item_counts.items() if c >= min_count),
+        dtype=object
+    )
+    if len(items) == 0:
+        return empty_itemsets, pd.DataFrame(columns=RULE_COLUMNS)
+    item_to_id = {x: i for i, x in enumerate(items)}
+    supports = np.array([item_counts[x] for x in items], dtype=np.float64) / n
+
+    k = len(items)
+    if numba is not None:
+        # Kernel JIT: matriz de presencia bit-packed de los items
+        # frecuentes y AND + popcount sobre todos los pares en paralelo
+        te_array = np.zeros((n, k), dtype=bool)
+        for row, t in enumerate(transactions):
+            for x in t:
+                col = item_to_id.get(x)
+                if col is not None:
+                    te_array[row, col] = True
+        bitmap = np.packbits(te_array, axis=0)
+        cand_i, cand_j = np.triu_indices(k, k=1)
+        cand_i = cand_i.astype(np.int64)
+        cand_j = cand_j.astype(np.int64)
+        pair_counts = _count_pair_supports(bitmap, cand_i, cand_j, _POPCOUNT8)
+    else:
+        # Sin numba: acumular sobre una triangular superior densa con
+        # np.add.at — indexado por ids enteros, sin hashear frozensets,
+        # y tocando solo pares que realmente co-ocurren
+        pair_mat = np.zeros((k, k), dtype=np.int32)
+        for t in transactions:
+            t_ids = np.unique([item_to_id[x] for x in t if x in item_to_id])
+            if len(t_ids) >= 2:
+                ii, jj = np.triu_indices(len(t_ids), k=1)
+                np.add.at(pair_mat, (t_ids[ii], t_ids[jj]), 1)
+        cand_i, cand_j = np.nonzero(pair_mat)
+        pair_counts = pair_mat[cand_i, cand_j]
+
+    itemset_rows = [
+        {"support": supports[i], "itemsets": frozenset([items[i]])}
+        for i in range(len(items))
+    ]
+    rule_rows = []
+    for i, j, count_ij in zip(cand_i, cand_j, pair_counts):
+        support_ij = count_ij / n
+        if support_ij < min_support:
+            continue
+        itemset_rows.append({
+            "support": support_ij,
+            "itemsets": frozenset([items[i], items[j]])
+        })
+        lift = support_ij / (supports[i] * supports[j])
+        if lift > 1.0:
+            for ant, con in ((i, j), (j, i)):
+                rule_rows.append({
+                    "antecedents": frozenset([items[ant]]),
+                    "consequents": frozenset([items[con]]),
+                    "support": support_ij,
+                    "confidence": support_ij / supports[ant],
+                    "lift": lift,
+                })
+
+    frequent_itemsets = pd.DataFrame(itemset_rows, columns=['support', 'itemsets'])
+    rules = pd.DataFrame(rule_rows, columns=RULE_COLUMNS)
+    return frequent_itemsets, rules
+
 def run_apriori(transactions):
     """
     Ejecuta el algoritmo Apriori y genera reglas de asociación.
     """
     log("🧮 Ejecutando algoritmo Apriori...")
 
-    te = TransactionEncoder()
-    te_array = te.fit(transactions).transform(transactions)
-    basket_matrix = pd.DataFrame(te_array, columns=te.columns_)
+    miner = _mine_efficient if ea_apriori is not None else _mine_bitmap
+    if miner is _mine_bitmap:
+        log("   ⚠️  efficient_apriori no disponible — usando conteo bitmap propio")
 
-    # Apriori con soporte mínimo de 1%
-    frequent_itemsets = apriori(
-        basket_matrix,
-        min_support=0.01,
-        use_colnames=True,
-        max_len=2
-    )
+    # Una sola corrida al 0.5% y filtrado en memoria: el soporte de una
+    # regla es el del par, así que rules[support >= 0.01] equivale a minar
+    # al 1% — sin la segunda pasada completa cuando el 1% queda vacío
+    frequent_itemsets, rules = miner(transactions, min_support=0.005)
 
-    if len(frequent_itemsets) == 0:
+    fi_01 = frequent_itemsets[frequent_itemsets['support'] >= 0.01]
+    if len(fi_01) > 0:
+        frequent_itemsets = fi_01
+        rules = rules[rules['support'] >= 0.01]
+    else:
         log("⚠️  No se encontraron itemsets frecuentes con soporte 1% — bajando a 0.5%")
-        frequent_itemsets = apriori(
-            basket_matrix,
-            min_support=0.005,
-            use_colnames=True,
-            max_len=2
-        )
 
     log(f"   → {len(frequent_itemsets)} itemsets frecuentes encontrados")
 
-    # Reglas de asociación con lift > 1.0
-    rules = association_rules(
-        frequent_itemsets,
-        metric="lift",
-        min_threshold=1.0
-    )
-
-    # Filtrar reglas de pares (no singles)
-    rules = rules[rules['antecedents'].apply(len) == 1]
-    rules = rules[rules['consequents'].apply(len) == 1]
+    # Filtrar reglas de pares (no singles) en una sola pasada:
+    # un único mask combinado en vez de dos filtrados pandas consecutivos
+    if len(rules) > 0:
+        ant_len = np.fromiter(
+            (len(x) for x in rules['antecedents'].values),
+            dtype=np.int32, count=len(rules)
+        )
+        con_len = np.fromiter(
+            (len(x) for x in rules['consequents'].values),
+            dtype=np.int32, count=len(rules)
+        )
+        rules = rules.iloc[(ant_len == 1) & (con_len == 1)]
 
-    # Formatear para exportar
-    rules['antecedents'] = rules['antecedents'].apply(lambda x: ', '.join(list(x)))
-    rules['consequents'] = rules['consequents'].apply(lambda x: ', '.join(list(x)))
-    rules['run_date'] = datetime.datetime.now().strftime("%Y-%m-%d")
+    # Formatear para exportar (otypes=object para no truncar strings largos)
+    _join_items = np.vectorize(lambda x: ', '.join(x), otypes=[object])
+    if len(rules) > 0:
+        rules['antecedents'] = _join_items(rules['antecedents'].values)
+        rules['consequents'] = _join_items(rules['consequents'].values)
+    rules['run_date'] = RUN_TS.strftime("%Y-%m-%d")
 
     rules = rules.sort_values('lift', ascending=False)
 
@@ -149,44 +401,69 @@ def run_apriori(transactions):
 def generate_executive_summary(rules, frequent_itemsets):
     """
     Genera resumen ejecutivo con los hallazgos más importantes.
+    Devuelve también top_rules para que save_outputs no recalcule el head.
     """
     top_rules = rules.head(10)
 
+    # Una sola extracción por columna; los conteos de negocio se calculan
+    # sobre los arrays cacheados en vez de tres filtrados pandas
+    lift = rules['lift'].to_numpy()
+    conf = rules['confidence'].to_numpy()
+
     summary = {
-        "run_date": datetime.datetime.now().strftime("%Y-%m-%d"),
-        "timestamp": datetime.datetime.now().isoformat(),
+        "run_date": RUN_TS.strftime("%Y-%m-%d"),
+        "timestamp": RUN_TS.isoformat(),
         "total_rules": len(rules),
         "total_itemsets": len(frequent_itemsets),
-        "top_lift": round(float(rules['lift'].max()), 2) if len(rules) > 0 else 0,
+        # rules ya viene ordenado por lift descendente — la primera fila
+        # es el máximo, sin escanear la columna
+        "top_lift": round(float(top_rules['lift'].iloc[0]), 2) if len(top_rules) > 0 else 0,
         "avg_lift_top10": round(float(top_rules['lift'].mean()), 2) if len(top_rules) > 0 else 0,
-        "max_confidence": round(float(rules['confidence'].max()), 2) if len(rules) > 0 else 0,
+        "max_confidence": round(float(conf.max()), 2) if len(rules) > 0 else 0,
         "top_association": f"{top_rules.iloc[0]['antecedents']} → {top_rules.iloc[0]['consequents']}" if len(top_rules) > 0 else "N/A",
         "top_lift_value": round(float(top_rules.iloc[0]['lift']), 2) if len(top_rules) > 0 else 0,
         "business_impact": {
-            "high_lift_rules": len(rules[rules['lift'] > 5]),
-            "medium_lift_rules": len(rules[(rules['lift'] >= 3) & (rules['lift'] <= 5)]),
-            "high_confidence_rules": len(rules[rules['confidence'] > 0.5])
+            "high_lift_rules": int((lift > 5).sum()),
+            "medium_lift_rules": int(((lift >= 3) & (lift <= 5)).sum()),
+            "high_confidence_rules": int((conf > 0.5).sum())
         }
     }
-    return summary
+    return summary, top_rules
+
+def _to_parquet_safe(df, path):
+    """
+    Escribe parquet (columnar, zstd) junto al CSV. Si no hay engine de
+    parquet instalado se omite sin romper el pipeline.
+    """
+    try:
+        df.to_parquet(path, compression='zstd', index=False)
+        log(f"   ✅ {path}")
+    except ImportError:
+        log(f"   ⚠️  Sin engine de parquet — se omite {os.path.basename(path)}")
 
-def save_outputs(rules, frequent_itemsets, summary):
+def save_outputs(rules, frequent_itemsets, summary, top_rules):
     """
     Guarda todos los outputs del pipeline.
     """
     log("💾 Guardando outputs...")
 
-    # Reglas de asociación
+    # Reglas de asociación — CSV para el dashboard, parquet para consumo
+    # analítico (5-10× más chico y sin parseo de floats)
     rules_path = os.path.join(OUTPUT_DIR, "fresh_rules_asociacion.csv")
     rules.to_csv(rules_path, index=False)
     log(f"   ✅ {rules_path}")
+    _to_parquet_safe(rules, os.path.join(OUTPUT_DIR, "fresh_rules_asociacion.parquet"))
 
     # Itemsets frecuentes
     itemsets_df = frequent_itemsets.copy()
-    itemsets_df['itemsets'] = itemsets_df['itemsets'].apply(lambda x: ', '.join(list(x)))
+    if len(itemsets_df) > 0:
+        itemsets_df['itemsets'] = np.vectorize(
+            lambda x: ', '.join(x), otypes=[object]
+        )(itemsets_df['itemsets'].values)
     itemsets_path = os.path.join(OUTPUT_DIR, "fresh_frequent_itemsets.csv")
     itemsets_df.to_csv(itemsets_path, index=False)
     log(f"   ✅ {itemsets_path}")
+    _to_parquet_safe(itemsets_df, os.path.join(OUTPUT_DIR, "fresh_frequent_itemsets.parquet"))
 
     # Resumen ejecutivo JSON
     summary_path = os.path.join(OUTPUT_DIR, "pipeline_summary.json")
@@ -194,9 +471,10 @@ def save_outputs(rules, frequent_itemsets, summary):
         json.dump(summary, f, indent=2, ensure_ascii=False)
     log(f"   ✅ {summary_path}")
 
-    # Top 10 reglas en CSV separado para el dashboard
+    # Top 10 reglas en CSV separado para el dashboard (ya calculadas
+    # en generate_executive_summary)
     top_rules_path = os.path.join(OUTPUT_DIR, "top10_rules.csv")
-    rules.head(10).to_csv(top_rules_path, index=False)
+    top_rules.to_csv(top_rules_path, index=False)
     log(f"   ✅ {top_rules_path}")
 
     return summary_path
@@ -205,31 +483,44 @@ def print_final_report(summary):
     """
     Imprime el reporte final en consola — n8n captura este output.
     """
-    report = f"""
-╔══════════════════════════════════════════════════════╗
-║           PIPELINE EJECUTADO EXITOSAMENTE            ║
-╠══════════════════════════════════════════════════════╣
-║  Fecha:              {summary['run_date']}                    
-║  Reglas generadas:   {summary['total_rules']}                        
-║  Lift máximo:        {summary['top_lift']}x                      
-║  Lift promedio top10:{summary['avg_lift_top10']}x                    
-║  Confianza máxima:   {summary['max_confidence']*100:.0f}%                    
-╠══════════════════════════════════════════════════════╣
-║  TOP ASOCIACIÓN:                                     
-║  {summary['top_association'][:48]}
-║  Lift: {summary['top_lift_value']}x                            
-╠══════════════════════════════════════════════════════╣
-║  IMPACTO DE NEGOCIO:                                 
-║  Reglas Lift>5:   {summary['business_impact']['high_lift_rules']} (recomendación on-site)  
-║  Reglas Lift 3-5: {summary['business_impact']['medium_lift_rules']} (bundle con descuento)  
-║  Alta Confianza:  {summary['business_impact']['high_confidence_rules']} (trigger en checkout)   
-╚══════════════════════════════════════════════════════╝
-PIPELINE_SUCCESS
-"""
+    impact = summary['business_impact']
+    lines = [
+        "",
+        "╔══════════════════════════════════════════════════════╗",
+        "║           PIPELINE EJECUTADO EXITOSAMENTE            ║",
+        "╠══════════════════════════════════════════════════════╣",
+        f"║  Fecha:              {summary['run_date']}                    ",
+        f"║  Reglas generadas:   {summary['total_rules']}                        ",
+        f"║  Lift máximo:        {summary['top_lift']}x                      ",
+        f"║  Lift promedio top10:{summary['avg_lift_top10']}x                    ",
+        f"║  Confianza máxima:   {summary['max_confidence']*100:.0f}%                    ",
+        "╠══════════════════════════════════════════════════════╣",
+        "║  TOP ASOCIACIÓN:                                     ",
+        f"║  {summary['top_association'][:48]}",
+        f"║  Lift: {summary['top_lift_value']}x                            ",
+        "╠══════════════════════════════════════════════════════╣",
+        "║  IMPACTO DE NEGOCIO:                                 ",
+        f"║  Reglas Lift>5:   {impact['high_lift_rules']} (recomendación on-site)  ",
+        f"║  Reglas Lift 3-5: {impact['medium_lift_rules']} (bundle con descuento)  ",
+        f"║  Alta Confianza:  {impact['high_confidence_rules']} (trigger en checkout)   ",
+        "╚══════════════════════════════════════════════════════╝",
+        "PIPELINE_SUCCESS",
+    ]
+    report = "\n".join(lines)
     print(report)
-    log(report)
+    # Directo al archivo, sin pasar por log(): el bloque multilínea no
+    # necesita prefijo de timestamp y antes se imprimía dos veces
+    if _LOG_FH is not None:
+        _LOG_FH.write(report + "\n")
+    else:
+        with open(LOG_FILE, "a", encoding="utf-8") as f:
+            f.write(report + "\n")
 
 def main():
+    global RUN_TS, _LOG_FH
+    RUN_TS = datetime.datetime.now()
+    _LOG_FH = open(LOG_FILE, "a", encoding="utf-8", buffering=8192)
+
     log("=" * 60)
     log("🚀 INICIANDO MARKET BASKET PIPELINE RUNNER")
     log("=" * 60)
@@ -245,10 +536,10 @@ def main():
         rules, frequent_itemsets = run_apriori(transactions)
 
         # Paso 4: Generar resumen
-        summary = generate_executive_summary(rules, frequent_itemsets)
+        summary, top_rules = generate_executive_summary(rules, frequent_itemsets)
 
         # Paso 5: Guardar outputs
-        save_outputs(rules, frequent_itemsets, summary)
+        save_outputs(rules, frequent_itemsets, summary, top_rules)
 
         # Paso 6: Reporte final
         print_final_report(summary)
@@ -262,5 +553,11 @@ def main():
         print(error_msg)
         return 1
 
+    finally:
+        # flush explícito para que el tail de n8n vea el reporte completo
+        _LOG_FH.flush()
+        _LOG_FH.close()
+        _LOG_FH = None
+
 if __name__ == "__main__":
     exit(main())